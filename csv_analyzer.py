@@ -2,9 +2,12 @@
 # Completed May 7, 2025
 # Purpose: GEOG 498 term project, core classes
 
+import numpy
 import pandas
 from osgeo import ogr
 from osgeo import osr
+import shapefile_writer
+import wkb_geometry
 osr.UseExceptions()
 
 class GeometryProcessor:
@@ -25,10 +28,21 @@ class GeometryProcessor:
         objectList = FieldItem.fromColumnNames(self.fields)
         return objectList
 
-    def createShapefile(self, wkid, output, fields):
+    def createShapefile(self, wkid, output, fields, native=False):
         """Abstract method for creating shapefile, to be overridden"""
         pass
 
+    def writeNativeShapefile(self, wkid, output, fields):
+        """Write the shapefile with the columnar writer, using the coordinates and feature offsets stored by
+        addGeometry"""
+        writer = shapefile_writer.ShapefileWriter(self.shapeType, self.coordinates, self.offsets)
+        writer.write(output, wkid, self.df, fields)
+
+    def getNodeCoordinates(self, nodeField):
+        """Parse a column of 'lat lon,lat lon' node strings into an array of x/y coordinates and the index of each
+        feature's first node"""
+        return wkb_geometry.parseNodes(self.df[nodeField])
+
 class FieldItem:
     """Object that represents a particular column of a dataframe, to be added as a shapefile field"""
     def __init__(self, name, formattedName):
@@ -63,7 +77,7 @@ class FieldItem:
         """Return data type for a field object that will be used in the creation of shapefile field"""
         # Check data type of column in the dataframe that the field name was obtained from
         df_data_type = df[self.name].dtype
-        if df_data_type == 'object':
+        if df_data_type == 'object' or df_data_type == 'str': # pandas 3 reads text columns as str
             return ogr.OFTString
 
         elif df_data_type == 'int64':
@@ -83,6 +97,8 @@ class FieldItem:
 
 class PointProcessor(GeometryProcessor):
     """Process a csv file containing point geometry and create a shapefile"""
+    shapeType = shapefile_writer.POINT
+
     def __init__(self, csv_file):
         super(PointProcessor, self).__init__(csv_file)
 
@@ -98,11 +114,20 @@ class PointProcessor(GeometryProcessor):
                 wkt_list.append(geom)
 
             self.df['geometry'] = wkt_list # Add the wkt geometries as a new df column
+            # Store x/y coordinates and one node per feature for the columnar writer
+            self.coordinates = numpy.column_stack((self.df[lonField].to_numpy(dtype=float),
+                                                   self.df[latField].to_numpy(dtype=float)))
+            self.offsets = numpy.arange(len(self.df) + 1)
         except:
             pass
 
     # Override createShapefile method
-    def createShapefile(self, wkid, output, fields):
+    def createShapefile(self, wkid, output, fields, native=False):
+        # The columnar writer runs outside the try block so that its errors reach the user
+        if native: # Write with the columnar writer instead of per-feature OGR calls
+            self.writeNativeShapefile(wkid, output, fields)
+            return
+
         try:
             # Create empty shapefile
             drv = ogr.GetDriverByName('ESRI Shapefile')  # OGR shapefile driver
@@ -142,6 +167,8 @@ class PointProcessor(GeometryProcessor):
 
 class PolylineProcessor(GeometryProcessor):
     """Process geometry and field attributes from a dataframe"""
+    shapeType = shapefile_writer.POLYLINE
+
     def __init__(self, csv_file):
         super(PolylineProcessor, self).__init__(csv_file)
         self.df = self.createNewDataframe()
@@ -182,28 +209,24 @@ class PolylineProcessor(GeometryProcessor):
         df = pandas.DataFrame(data)
         return df
 
-    def addGeometry(self, nodeField):
-        """Get wkt linestrings from node list"""
+    def addGeometry(self, nodeField, native=False):
+        """Get wkb linestrings from node list. With native, only the coordinates that the columnar writer reads are
+        stored"""
         try:
-            wkt_list = []
-            nodeIndex = self.fields.get_loc(nodeField)
-            for row in self.df.itertuples(name=None, index=False):
-                XYList = []
-                # Get individual lat/long values from each node
-                for node in row[nodeIndex].split(','):
-                    lat = node.split(' ')[0]
-                    lon = node.split(' ')[1]
-                    XYList.append(f"{lon} {lat}")
-                geom = f"LINESTRING ({','.join(XYList)})"  # Create WKT polyline string
-
-                wkt_list.append(geom)
-
-            self.df['geometry'] = wkt_list # Add geometry column with wkt linestrings to the dataframe
+            # Coordinates and feature offsets are also used directly by the columnar writer
+            self.coordinates, self.offsets = self.getNodeCoordinates(nodeField)
+            if not native:
+                # Build wkb linestrings and add them as the geometry column
+                self.df['geometry'] = wkb_geometry.buildWKB(wkb_geometry.LINESTRING, self.coordinates, self.offsets)
 
         except:
             pass
-    def createShapefile(self, wkid, output, fields):
+    def createShapefile(self, wkid, output, fields, native=False):
         """Process reformatted dataframe to add geometry and fields to a new shapefile"""
+        if native: # Write with the columnar writer instead of per-feature OGR calls
+            self.writeNativeShapefile(wkid, output, fields)
+            return
+
         # Create empty shapefile
         try:
             drv = ogr.GetDriverByName('ESRI Shapefile')  # OGR shapefile driver
@@ -225,8 +248,8 @@ class PolylineProcessor(GeometryProcessor):
 
             # Loop through dataframe rows and add features
             for row in self.df.itertuples(name=None, index=False):
-                geom = row[geomIndex]  # Access wkt linestring for the given row
-                outgeom = ogr.CreateGeometryFromWkt(geom)  # Create geometry object from linestring
+                geom = row[geomIndex]  # Access wkb linestring for the given row
+                outgeom = ogr.CreateGeometryFromWkb(geom)  # Create geometry object from linestring
                 outFeature = ogr.Feature(featureDefn)  # Create new feature
                 outFeature.SetGeometry(outgeom)  # Add geometry to feature
                 # Add values from dataframe for each field object
@@ -244,6 +267,8 @@ class PolylineProcessor(GeometryProcessor):
 
 class PolygonProcessor(GeometryProcessor):
     """Process geometry and field attributes from a dataframe"""
+    shapeType = shapefile_writer.POLYGON
+
     def __init__(self, csv_file):
         super(PolygonProcessor, self).__init__(csv_file)
         self.df = self.createNewDataframe()
@@ -287,27 +312,23 @@ class PolygonProcessor(GeometryProcessor):
         df = pandas.DataFrame(data)
         return df
 
-    def addGeometry(self, nodeField):
+    def addGeometry(self, nodeField, native=False):
          try:
-            """Get wkt polygon strings from node list"""
-            wkt_list = []
-            nodeIndex = self.fields.get_loc(nodeField)
-            for row in self.df.itertuples(name=None, index=False):
-                XYList = []
-                # Get individual lat/long values from each node
-                for node in row[nodeIndex].split(','):
-                    lat = node.split(' ')[0]
-                    lon = node.split(' ')[1]
-                    XYList.append(f"{lon} {lat}")
-                geom = f"POLYGON (({','.join(XYList)}))" # Create WKT polygon string
-
-                wkt_list.append(geom)
-
-            self.df['geometry'] = wkt_list # Add geometry column with wkt strings to the dataframe
+            """Get wkb polygons from node list. With native, only the coordinates that the columnar writer reads are
+            stored"""
+            # Coordinates and feature offsets are also used directly by the columnar writer
+            self.coordinates, self.offsets = self.getNodeCoordinates(nodeField)
+            if not native:
+                # Build wkb polygons and add them as the geometry column
+                self.df['geometry'] = wkb_geometry.buildWKB(wkb_geometry.POLYGON, self.coordinates, self.offsets)
          except:
              pass
 
-    def createShapefile(self, wkid, output, fields):
+    def createShapefile(self, wkid, output, fields, native=False):
+        if native: # Write with the columnar writer instead of per-feature OGR calls
+            self.writeNativeShapefile(wkid, output, fields)
+            return
+
         try:
             """Process reformatted dataframe to add geometry and fields to a new shapefile"""
             # Create empty shapefile
@@ -330,8 +351,8 @@ class PolygonProcessor(GeometryProcessor):
 
             # Loop through dataframe rows and add features
             for row in self.df.itertuples(name=None, index=False):
-                geom = row[geomIndex] # Get LineString containing trip coordinates
-                outgeom = ogr.CreateGeometryFromWkt(geom) # Create wkt geometry object from LineString
+                geom = row[geomIndex] # Get wkb polygon
+                outgeom = ogr.CreateGeometryFromWkb(geom) # Create geometry object from wkb polygon
                 outFeature = ogr.Feature(featureDefn) # Create new feature
                 outFeature.SetGeometry(outgeom) # Add geometry to feature
                 # Add values from dataframe for each field object
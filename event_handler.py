@@ -2,17 +2,17 @@
 # Completed May 7, 2025
 # Purpose: GEOG 498 term project, GUI event handler
 
-import sys, os
+import sys, os, time, threading, importlib
+startTime = time.perf_counter() # Reference point for the startup profile
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QMessageBox
 import main
-import csv_analyzer
+qtLoadedTime = time.perf_counter()
 
-# Initialize app and main window
-app = QApplication(sys.argv)
-mainWindow = QMainWindow()
-# Create instance of main ui class, and call set up method
-ui = main.Ui_MainWindow()
-ui.setupUi(mainWindow)
+# Run with --profile-startup to print how long each stage of startup takes. For a per-module breakdown of every
+# import, run with python -X importtime instead
+profileStartup = '--profile-startup' in sys.argv
+startupTimes = [('import PyQt5 and main', qtLoadedTime - startTime)] # (stage, seconds) pairs
 
 # ====================================================================================================================
 
@@ -21,11 +21,59 @@ geometryList = ['Point', 'Polyline', 'Polygon']
 defaultSR = '4326'
 currentInstance = None
 selectedFields = []
-
-for geometry in geometryList:
-    ui.featureTypeCB.addItem(geometry)
-
-ui.spatialReferenceLE.setText(defaultSR)
+# Run with --native-writer to write shapefiles with the columnar writer rather than per-feature OGR calls
+nativeWriter = '--native-writer' in sys.argv
+
+# Lazy loading of the data processing modules
+
+# pandas and GDAL take seconds to import, so they are loaded on a background thread once the window is showing.
+# csv_analyzer is last because it imports the others
+heavyModules = ['numpy', 'pandas', 'osgeo.ogr', 'osgeo.osr', 'csv_analyzer']
+loaderError = None # Exception raised while loading the modules, if any
+loaderErrorShown = False # The error is shown once, since the csv line edit asks for the modules on every keystroke
+
+def printStartupProfile():
+    """Print the time taken by each recorded startup stage"""
+    print("Startup profile:", file=sys.stderr)
+    for stage, seconds in startupTimes:
+        print(f"  {stage:<30}{seconds * 1000:10.1f} ms", file=sys.stderr)
+
+def loadHeavyModules():
+    """Import the data processing modules in order, recording how long each one takes. A failed import is kept in
+    loaderError, since an exception raised on this thread would never reach the user"""
+    global loaderError
+    try:
+        for name in heavyModules:
+            since = time.perf_counter()
+            importlib.import_module(name)
+            startupTimes.append((f"import {name}", time.perf_counter() - since))
+    except Exception as e:
+        loaderError = e
+    if profileStartup:
+        printStartupProfile()
+
+loader = threading.Thread(target=loadHeavyModules, daemon=True)
+
+def windowShown():
+    """Start loading the data processing modules once the event loop is running and the window is drawn"""
+    startupTimes.append(('window shown (total)', time.perf_counter() - startTime))
+    loader.start()
+
+def getAnalyzer():
+    """Return the csv_analyzer module, waiting for the background loader if it is still running. If the loader
+    failed, its error is shown and raised"""
+    global loaderErrorShown
+    if loader.is_alive():
+        loader.join()
+    if loaderError is not None:
+        if not loaderErrorShown:
+            loaderErrorShown = True
+            QMessageBox.critical(
+                mainWindow, "Error",
+                f"The data processing modules could not be loaded: {loaderError}",
+                QMessageBox.Ok)
+        raise loaderError
+    return importlib.import_module('csv_analyzer')
 
 # Event handler functions
 
@@ -55,6 +103,7 @@ def setCurrentInstance():
     """Make a new instance of a Processor object with the selected CSV file"""
     try:
         global currentInstance # Access global currentInstance variable
+        csv_analyzer = getAnalyzer()
         # Check which geometry is selected in the feature type combo box, and create instance with the
         # corresponding class
         if ui.featureTypeCB.currentText() == 'Point':
@@ -165,6 +214,7 @@ def createShapefile():
     """Call the method that creates a new shapefile, and provide it with the selected parameters"""
 
     try:
+        csv_analyzer = getAnalyzer() # Raises the loader's error, if any, rather than reporting a missing csv
 
         if ui.addAllFieldsCB.isChecked(): # Check if user has selected the All Fields checkbox
             # If the checkbox is toggled, the field_list variable is assigned an instance variable from class CSVConverter
@@ -183,12 +233,14 @@ def createShapefile():
         else:
             currentInstance.addGeometry(
                 nodeField=ui.nodeFieldCB.currentText(),
+                native=nativeWriter,
             )
         # Call the create shapefile method
         currentInstance.createShapefile(
         wkid=ui.spatialReferenceLE.text(),
         output=ui.selectShapefileLE.text(),
-        fields=field_list
+        fields=field_list,
+        native=nativeWriter
         )
 
         # Get shapefile basename for success message
@@ -201,7 +253,7 @@ def createShapefile():
 
 
     except Exception as e:
-        if e.name == 'addGeometry':
+        if getattr(e, 'name', None) == 'addGeometry': # Only some exceptions, such as AttributeError, have a name
             errorMessage = "Please select a valid CSV file"
             QMessageBox.information(mainWindow, "Error", f"{errorMessage}", QMessageBox.Ok)
         else:
@@ -209,17 +261,33 @@ def createShapefile():
 
 # =====================================================================================================================
 
-# Connect signals
-ui.selectCSVTB.clicked.connect(selectCSV) # When the select csv file tool button is clicked
-ui.selectShapefileTB.clicked.connect(shapefileOutput) # When the select output shapefile tool button is clicked
-ui.selectCSVLE.textChanged.connect(csvLineEditTextChanged) # When the text in the select csv line edit is changed
-ui.addAllFieldsCB.toggled.connect(checkAddAllFieldsCB) # When the all fields checkbox is toggled
-ui.featureTypeCB.currentTextChanged.connect(featureTypeChanged) # When a new feature type is selected
-ui.clearSelectionPB.clicked.connect(clearListWidget) # When the clear list widget button is clicked
-ui.selectFieldCB.textActivated.connect(selectFields) # When an item from the field combo box is selected
-ui.runPB.clicked.connect(createShapefile) # When the run button is clicked
-
-
-# Run app
-mainWindow.show()
-sys.exit(app.exec_())
+# The window is only created when this file is run directly, so the event handlers can be imported without opening it
+if __name__ == '__main__':
+    # Initialize app and main window
+    app = QApplication(sys.argv)
+    mainWindow = QMainWindow()
+    # Create instance of main ui class, and call set up method
+    ui = main.Ui_MainWindow()
+    ui.setupUi(mainWindow)
+    startupTimes.append(('set up main window', time.perf_counter() - qtLoadedTime))
+
+    for geometry in geometryList:
+        ui.featureTypeCB.addItem(geometry)
+
+    ui.spatialReferenceLE.setText(defaultSR)
+
+    # Connect signals
+    ui.selectCSVTB.clicked.connect(selectCSV) # When the select csv file tool button is clicked
+    ui.selectShapefileTB.clicked.connect(shapefileOutput) # When the select output shapefile tool button is clicked
+    ui.selectCSVLE.textChanged.connect(csvLineEditTextChanged) # When the text in the select csv line edit is changed
+    ui.addAllFieldsCB.toggled.connect(checkAddAllFieldsCB) # When the all fields checkbox is toggled
+    ui.featureTypeCB.currentTextChanged.connect(featureTypeChanged) # When a new feature type is selected
+    ui.clearSelectionPB.clicked.connect(clearListWidget) # When the clear list widget button is clicked
+    ui.selectFieldCB.textActivated.connect(selectFields) # When an item from the field combo box is selected
+    ui.runPB.clicked.connect(createShapefile) # When the run button is clicked
+
+
+    # Run app
+    mainWindow.show()
+    QTimer.singleShot(0, windowShown) # Runs after the window has been shown by the event loop
+    sys.exit(app.exec_())
@@ -0,0 +1,400 @@
+# Purpose: GEOG 498 term project, columnar shapefile writer
+
+import datetime
+import os
+import struct
+import numpy
+import pandas
+
+# Shape type codes from the ESRI shapefile specification
+POINT = 1
+POLYLINE = 3
+POLYGON = 5
+
+# Fixed-size portions of each .shp record. Polyline and polygon features are always written as a single part, so
+# the part index array is one integer long and only the points that follow vary in size
+POINT_RECORD = numpy.dtype([('number', '>i4'), ('length', '>i4'), ('shapeType', '<i4'),
+                            ('x', '<f8'), ('y', '<f8')])
+POLY_RECORD = numpy.dtype([('number', '>i4'), ('length', '>i4'), ('shapeType', '<i4'), ('box', '<f8', (4,)),
+                           ('numParts', '<i4'), ('numPoints', '<i4'), ('part', '<i4')])
+INDEX_RECORD = numpy.dtype([('offset', '>i4'), ('length', '>i4')])
+
+# Largest .shp file the format can describe, since file lengths and record offsets are signed 32-bit counts of
+# 16-bit words
+MAX_FILE_BYTES = 2 * (2 ** 31 - 1)
+
+# Widest field a dBase file can hold
+MAX_FIELD_WIDTH = 254
+
+# Characters used in .dbf fields
+SPACE = ord(' ')
+MINUS = ord('-')
+DECIMAL_POINT = ord('.')
+
+# Powers of ten used to count the decimal digits of unsigned 64-bit integers
+POWERS_OF_TEN = [numpy.uint64(10 ** k) for k in range(1, 20)]
+
+# ASCII digits of every number from 0000 to 9999, so digits can be written four at a time
+DIGIT_GROUPS = numpy.frombuffer(b''.join(b'%04d' % k for k in range(10000)), dtype=numpy.uint8).reshape(-1, 4)
+
+# Bytes of records copied at a time when filling an output buffer, which keeps the index arrays small
+COPY_BLOCK_BYTES = 1 << 20
+
+
+def copyRows(out, destinations, rows):
+    """Copy each row of a 2D uint8 array into the out buffer, starting at the matching destination byte"""
+    rowWidth = rows.shape[1]
+    blockRows = max(1, COPY_BLOCK_BYTES // rowWidth)
+    columns = numpy.arange(rowWidth)
+    for first in range(0, len(rows), blockRows):
+        out[destinations[first:first + blockRows, None] + columns] = rows[first:first + blockRows]
+
+
+class ShapefileWriter:
+    """Write the .shp, .shx, .dbf, .prj, and .cpg files of a shapefile directly from NumPy arrays, instead of making
+    OGR calls for every feature and field"""
+    def __init__(self, shapeType, coordinates, offsets):
+        self.shapeType = shapeType
+        self.coordinates = numpy.ascontiguousarray(coordinates, dtype='<f8').reshape(-1, 2) # x/y node pairs
+        self.offsets = numpy.asarray(offsets, dtype=numpy.int64) # Index of each feature's first node, plus the end
+        self.starts = self.offsets[:-1]
+        self.counts = numpy.diff(self.offsets)
+        self.featureCount = len(self.counts)
+        if self.shapeType == POLYGON:
+            self.rewindPolygons()
+
+    def rewindPolygons(self):
+        """Reverse counterclockwise rings so that every polygon is clockwise, as OGR does when writing outer rings"""
+        if not len(self.coordinates):
+            return
+        # Measure each node from its ring's first node, so small rings far from the origin keep their precision
+        firstNode = numpy.repeat(self.starts, self.counts)
+        x = self.coordinates[:, 0] - self.coordinates[firstNode, 0]
+        y = self.coordinates[:, 1] - self.coordinates[firstNode, 1]
+        # Shoelace term for each node and the one after it, leaving out the pair that spans two rings
+        cross = numpy.zeros(len(x))
+        cross[:-1] = x[:-1] * y[1:] - x[1:] * y[:-1]
+        ends = self.offsets[1:]
+        cross[ends[ends > 0] - 1] = 0.0
+        area = numpy.add.reduceat(cross, numpy.minimum(self.starts, len(cross) - 1)) # Sum each ring separately
+        area[self.counts < 3] = 0.0
+        flip = area > 0 # Positive area means the ring is counterclockwise
+
+        if flip.any():
+            featureIndex = numpy.repeat(numpy.arange(self.featureCount), self.counts)
+            pointFlip = flip[featureIndex]
+            order = numpy.arange(len(self.coordinates))
+            # Mirror each flipped node's position within its own ring
+            order[pointFlip] = (self.starts + ends - 1)[featureIndex[pointFlip]] - order[pointFlip]
+            self.coordinates = self.coordinates[order]
+
+    def getHeader(self, fileLength):
+        """Return the 100 byte header shared by the .shp and .shx files"""
+        if len(self.coordinates):
+            xmin, ymin = self.coordinates.min(axis=0)
+            xmax, ymax = self.coordinates.max(axis=0)
+        else:
+            xmin = ymin = xmax = ymax = 0.0
+        header = struct.pack('>7i', 9994, 0, 0, 0, 0, 0, fileLength // 2) # File code and length in 16-bit words
+        header += struct.pack('<2i8d', 1000, self.shapeType, xmin, ymin, xmax, ymax, 0.0, 0.0, 0.0, 0.0)
+        return header
+
+    def getContentLengths(self):
+        """Return the length in bytes of each .shp record after its 8 byte record header"""
+        if self.shapeType == POINT:
+            return numpy.full(self.featureCount, POINT_RECORD.itemsize - 8, dtype=numpy.int64)
+        return POLY_RECORD.itemsize - 8 + 16 * self.counts
+
+    def getPointRecords(self):
+        """Return .shp record bytes for a point layer"""
+        records = numpy.zeros(self.featureCount, dtype=POINT_RECORD)
+        records['number'] = numpy.arange(1, self.featureCount + 1)
+        records['length'] = (POINT_RECORD.itemsize - 8) // 2
+        records['shapeType'] = POINT
+        records['x'] = self.coordinates[self.starts, 0]
+        records['y'] = self.coordinates[self.starts, 1]
+        return records.tobytes()
+
+    def getPolyRecords(self, contentLengths):
+        """Return .shp record bytes as a uint8 array for a polyline or polygon layer"""
+        records = numpy.zeros(self.featureCount, dtype=POLY_RECORD)
+        records['number'] = numpy.arange(1, self.featureCount + 1)
+        records['length'] = contentLengths // 2
+        records['shapeType'] = self.shapeType
+        records['numParts'] = 1
+        records['numPoints'] = self.counts
+
+        # Bounding boxes for every feature at once
+        if self.featureCount:
+            x = self.coordinates[:, 0]
+            y = self.coordinates[:, 1]
+            records['box'][:, 0] = numpy.minimum.reduceat(x, self.starts)
+            records['box'][:, 1] = numpy.minimum.reduceat(y, self.starts)
+            records['box'][:, 2] = numpy.maximum.reduceat(x, self.starts)
+            records['box'][:, 3] = numpy.maximum.reduceat(y, self.starts)
+
+        # Allocate the body once, then copy each fixed-size record and the points that follow it into place
+        recordLengths = contentLengths + 8
+        recordStarts = numpy.concatenate(([0], numpy.cumsum(recordLengths)[:-1]))
+        body = numpy.empty(int(recordLengths.sum()), dtype=numpy.uint8)
+        copyRows(body, recordStarts, records.view(numpy.uint8).reshape(-1, POLY_RECORD.itemsize))
+        pointStarts = numpy.repeat(recordStarts + POLY_RECORD.itemsize - 16 * self.starts, self.counts)
+        pointStarts += 16 * numpy.arange(len(self.coordinates))
+        copyRows(body, pointStarts, self.coordinates.view(numpy.uint8).reshape(-1, 16))
+        return body
+
+    def getSHP(self):
+        """Return the contents of the .shp geometry file and its .shx index, each as a list of byte strings"""
+        # Check the size before building anything, since offsets past the limit would wrap around in the index
+        contentLengths = self.getContentLengths()
+        recordLengths = contentLengths + 8
+        fileLength = 100 + int(recordLengths.sum())
+        if fileLength > MAX_FILE_BYTES:
+            raise ValueError(f"The geometry of this layer needs {fileLength:,} bytes, but a shapefile can only hold "
+                             f"{MAX_FILE_BYTES:,}")
+
+        if self.shapeType == POINT:
+            body = self.getPointRecords()
+        else:
+            body = self.getPolyRecords(contentLengths)
+
+        # Precompute where each record starts in the .shp file, in 16-bit words
+        recordOffsets = 100 + numpy.concatenate(([0], numpy.cumsum(recordLengths)[:-1]))
+        index = numpy.zeros(self.featureCount, dtype=INDEX_RECORD)
+        index['offset'] = recordOffsets // 2
+        index['length'] = contentLengths // 2
+
+        shp = [self.getHeader(fileLength), body]
+        shx = [self.getHeader(100 + index.nbytes), index.tobytes()]
+        return shp, shx
+
+    def getDBF(self, df, fields):
+        """Return the contents of the .dbf attribute file as a list of byte strings, one row of bytes per feature,
+        with fields built a column at a time"""
+        specs = [] # Type, width, and decimal count of each field
+        columns = [] # Field bytes of each column, one row per feature
+        for fieldObject in fields:
+            column = df[fieldObject.name]
+            fieldType, width, decimals = getFieldSpec(column)
+            values = formatColumn(column, fieldType, width, decimals)
+            # Numbers that do not fit OGR's default width widen the field rather than lose digits
+            width = values.shape[1]
+            if width > MAX_FIELD_WIDTH:
+                raise ValueError(f"Values of field {fieldObject.name} are too wide for a shapefile")
+            specs.append((fieldType, width, decimals))
+            columns.append(values)
+
+        recordLength = 1 + sum(width for _, width, _ in specs)
+        records = numpy.full((self.featureCount, recordLength), SPACE, dtype=numpy.uint8) # Blank deletion flags
+        position = 1
+        for values in columns:
+            records[:, position:position + values.shape[1]] = values
+            position += values.shape[1]
+
+        today = datetime.date.today()
+        headerLength = 32 + 32 * len(fields) + 1
+        header = struct.pack('<4BIHH20x', 3, today.year - 1900, today.month, today.day, self.featureCount,
+                             headerLength, recordLength)
+        for fieldObject, (fieldType, width, decimals) in zip(fields, specs):
+            name = fieldObject.formattedName.encode('utf-8')[:10]
+            header += struct.pack('<11sc4xBB14x', name, fieldType.encode('ascii'), width, decimals)
+
+        # Field descriptor terminator before the records, and end of file marker after them
+        return [header, b'\r', records, b'\x1a']
+
+    def getPRJ(self, wkid):
+        """Return the contents of the .prj file in the ESRI WKT flavor that OGR writes"""
+        from osgeo import osr # Imported here so that the rest of the writer can be used and tested without GDAL
+        osr.UseExceptions()
+        sr = osr.SpatialReference()
+        sr.ImportFromEPSG(int(wkid))
+        sr.MorphToESRI()
+        return [sr.ExportToWkt().encode('utf-8')]
+
+    def write(self, output, wkid, df, fields):
+        """Write all files of the shapefile, named after the output .shp path. Every file is built before any is
+        written, so a layer that cannot be written leaves no partial shapefile behind"""
+        base = os.path.splitext(output)[0]
+        shp, shx = self.getSHP()
+        files = {'.shp': shp, '.shx': shx, '.dbf': self.getDBF(df, fields), '.prj': self.getPRJ(wkid),
+                 '.cpg': [b'UTF-8']} # Attribute strings are written as UTF-8
+        for extension, parts in files.items():
+            with open(base + extension, 'wb') as file:
+                for part in parts:
+                    file.write(part)
+
+
+def getFieldSpec(column):
+    """Return the dBase type, width, and decimal count that OGR uses by default for a dataframe column"""
+    if column.dtype == 'object' or column.dtype == 'str': # pandas 3 reads text columns as str
+        return ('C', 80, 0)
+
+    elif column.dtype == 'int64':
+        return ('N', 9, 0)
+
+    elif column.dtype == 'float64':
+        return ('N', 24, 15)
+
+    raise ValueError(f"Field {column.name} has unsupported data type {column.dtype}")
+
+
+def formatColumn(column, fieldType, width, decimals):
+    """Return a dataframe column as a uint8 array with one row of dBase field bytes per value. Numeric fields come
+    back wider than width if their longest value needs it"""
+    if not len(column):
+        # An empty layer, such as one from a csv with only a header, still gets its field definitions
+        return numpy.empty((0, width), dtype=numpy.uint8)
+    if fieldType == 'C':
+        # Attribute text repeats a lot, so each distinct string is encoded once. Missing values are coded -1, which
+        # picks the blank row added at the end
+        codes, uniques = pandas.factorize(column)
+        text = numpy.asarray(uniques.astype(str), dtype=str)
+        rows = numpy.concatenate((formatStrings(text, width), numpy.full((1, width), SPACE, dtype=numpy.uint8)))
+        return rows[codes]
+
+    missing = column.isna().to_numpy()
+    if decimals:
+        return formatReals(column.to_numpy(), missing, width, decimals)
+    return formatIntegers(column.to_numpy(), missing, width)
+
+
+def countDigits(magnitudes):
+    """Return the number of decimal digits in each unsigned 64-bit integer, counting zero as one digit"""
+    digitCounts = numpy.ones(len(magnitudes), dtype=numpy.int64)
+    for power in POWERS_OF_TEN:
+        digitCounts += magnitudes >= power
+    return digitCounts
+
+
+def placeDigits(out, magnitudes, digitCounts, end):
+    """Write the decimal digits of each magnitude into its row of out, with the last digit just before column end.
+    Rows with a digit count of zero are left blank"""
+    digitTotal = int(digitCounts.max(initial=0))
+    groupTotal = -(-digitTotal // 4)
+    digits = numpy.empty((len(magnitudes), 4 * groupTotal), dtype=numpy.uint8)
+    remaining = magnitudes
+    for group in range(groupTotal):
+        remaining, low = numpy.divmod(remaining, 10000)
+        digits[:, 4 * (groupTotal - 1 - group):4 * (groupTotal - group)] = DIGIT_GROUPS[low]
+    # Leading zeros past each value's own digits are left blank
+    leading = numpy.arange(digitTotal - 1, -1, -1) >= digitCounts[:, None]
+    out[:, end - digitTotal:end] = numpy.where(leading, SPACE, digits[:, 4 * groupTotal - digitTotal:])
+
+
+def placeSigns(out, negative, digitCounts, end):
+    """Write a minus sign just before the digits of each negative row, whose digits end before column end"""
+    rows = numpy.flatnonzero(negative)
+    out[rows, end - 1 - digitCounts[rows]] = MINUS
+
+
+def formatIntegers(values, missing, width):
+    """Return integers right aligned as printf %d writes them, and blanks for missing values"""
+    values = numpy.asarray(values, dtype=numpy.int64)
+    negative = (values < 0) & ~missing
+    magnitudes = values.astype(numpy.uint64)
+    magnitudes[negative] = ~magnitudes[negative] + numpy.uint64(1) # Two's complement, so -2**63 is safe
+    digitCounts = countDigits(magnitudes)
+    digitCounts[missing] = 0
+
+    fieldWidth = max(width, int((digitCounts + negative).max(initial=0)))
+    out = numpy.full((len(values), fieldWidth), SPACE, dtype=numpy.uint8)
+    placeDigits(out, magnitudes, digitCounts, fieldWidth)
+    placeSigns(out, negative, digitCounts, fieldWidth)
+    return out
+
+
+def splitFloat(values):
+    """Split each double into high and low halves of 26 bits, whose products with other halves are exact"""
+    scaled = 134217729.0 * values # 2**27 + 1
+    high = scaled - (scaled - values)
+    return high, values - high
+
+
+def multiplyExact(values, factor):
+    """Return each product rounded to a double, along with the rounding error, so that the two sum exactly to the
+    true product"""
+    product = values * factor
+    valueHigh, valueLow = splitFloat(values)
+    factorHigh, factorLow = splitFloat(numpy.float64(factor))
+    error = ((valueHigh * factorHigh - product) + valueHigh * factorLow + valueLow * factorHigh) + valueLow * factorLow
+    return product, error
+
+
+def formatReals(values, missing, width, decimals):
+    """Return doubles right aligned as printf %.{decimals}f writes them, and blanks for missing values. decimals can
+    be at most 15, so that the scaled fraction is an exact integer"""
+    values = numpy.asarray(values, dtype=numpy.float64)
+    absolute = numpy.abs(values)
+    # Whole parts past 64 bits, and infinities, are formatted one at a time below
+    exact = ~missing & (absolute < 2.0 ** 63)
+    absolute = numpy.where(exact, absolute, 0.0)
+    negative = numpy.signbit(values) & exact
+    whole = numpy.floor(absolute)
+
+    # Round the fraction to decimals places the way printf does, from the exact value of the double. The rounding
+    # error of the scaled fraction settles values that land on or next to a half
+    scale = 10.0 ** decimals
+    scaled, error = multiplyExact(absolute - whole, scale)
+    lower = numpy.floor(scaled)
+    remainder = scaled - lower
+    roundUp = (remainder > 0.5) | ((remainder == 0.5) & ((error > 0) | ((error == 0) & (lower % 2 == 1))))
+    fraction = lower + roundUp
+    carry = fraction >= scale
+    fraction[carry] = 0.0
+    whole[carry] += 1.0
+
+    wholeMagnitudes = whole.astype(numpy.uint64)
+    digitCounts = countDigits(wholeMagnitudes)
+    digitCounts[~exact] = 0
+    lengths = numpy.where(exact, negative + digitCounts + 1 + decimals, 0)
+
+    fallbackRows = numpy.flatnonzero(~exact & ~missing)
+    fallbackText = [(f'%.{decimals}f' % values[i]).encode('ascii') for i in fallbackRows]
+    fieldWidth = max(width, int(lengths.max(initial=0)), max(map(len, fallbackText), default=0))
+
+    out = numpy.full((len(values), fieldWidth), SPACE, dtype=numpy.uint8)
+    pointColumn = fieldWidth - 1 - decimals
+    placeDigits(out, fraction.astype(numpy.uint64), numpy.where(exact, decimals, 0), fieldWidth)
+    out[exact, pointColumn] = DECIMAL_POINT
+    placeDigits(out, wholeMagnitudes, digitCounts, pointColumn)
+    placeSigns(out, negative, digitCounts, pointColumn)
+    for row, text in zip(fallbackRows, fallbackText):
+        out[row, fieldWidth - len(text):] = numpy.frombuffer(text, dtype=numpy.uint8)
+    return out
+
+
+def formatStrings(text, width):
+    """Return strings UTF-8 encoded and left aligned in rows of width bytes. A string that does not fit is cut after
+    its last whole character"""
+    rowCount = len(text)
+    out = numpy.full((rowCount, width), SPACE, dtype=numpy.uint8)
+    if not rowCount:
+        return out
+    # Every character takes at least one byte, so only the first width characters can fit
+    codes = text.view(numpy.uint32).reshape(rowCount, -1)[:, :width]
+    # ASCII rows take one byte per character. Unused characters are zero
+    ascii = codes.max(axis=1, initial=0) < 0x80
+    out[ascii, :codes.shape[1]] = numpy.where(codes[ascii] == 0, SPACE, codes[ascii])
+    if ascii.all():
+        return out
+
+    # Other rows are encoded a byte position at a time
+    outRows = numpy.flatnonzero(~ascii)
+    codes = codes[outRows]
+
+    byteCounts = (codes > 0).astype(numpy.int32) + (codes >= 0x80) + (codes >= 0x800) + (codes >= 0x10000)
+    ends = numpy.cumsum(byteCounts, axis=1, dtype=numpy.int32)
+    starts = ends - byteCounts
+    fits = ends <= width
+    leadBits = numpy.array([0, 0, 0xC0, 0xE0, 0xF0], dtype=numpy.uint32) # First byte marker by sequence length
+    for position in range(4):
+        rows, columns = numpy.nonzero(fits & (byteCounts > position))
+        code = codes[rows, columns]
+        count = byteCounts[rows, columns]
+        bits = code >> (6 * (count - 1 - position)).astype(numpy.uint32)
+        if position == 0:
+            value = leadBits[count] | bits
+        else:
+            value = 0x80 | (bits & 0x3F)
+        out[outRows[rows], starts[rows, columns] + position] = value
+    return out
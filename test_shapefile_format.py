@@ -0,0 +1,174 @@
+# Purpose: GEOG 498 term project, checks the bytes of the columnar shapefile writer's output without GDAL
+
+import struct
+from types import SimpleNamespace
+import numpy
+import pytest
+
+pandas = pytest.importorskip('pandas')
+
+import shapefile_writer
+
+
+def makeFields(df):
+    """Return field objects for every column of a dataframe, as csv_analyzer.FieldItem provides them"""
+    return [SimpleNamespace(name=name, formattedName=name[:10]) for name in df.columns]
+
+
+def readSHP(writer):
+    """Return the header and records of the .shp file, and the records of the .shx file, read back with struct"""
+    shp, shx = writer.getSHP()
+    shpBytes = b''.join(bytes(part) for part in shp)
+    shxBytes = b''.join(bytes(part) for part in shx)
+    fileCode, fileLength = struct.unpack('>i20xi', shpBytes[:28])
+    version, shapeType, *box = struct.unpack('<2i4d', shpBytes[28:68])
+    assert fileCode == 9994
+    assert version == 1000
+    assert fileLength * 2 == len(shpBytes)
+    assert shxBytes[:24] + shxBytes[28:100] == shpBytes[:24] + shpBytes[28:100] # Same header apart from length
+    assert struct.unpack('>i', shxBytes[24:28])[0] * 2 == len(shxBytes)
+
+    records = []
+    index = []
+    position = 100
+    while position < len(shpBytes):
+        number, contentLength = struct.unpack('>2i', shpBytes[position:position + 8])
+        assert number == len(records) + 1
+        index.append((position // 2, contentLength))
+        records.append(shpBytes[position + 8:position + 8 + contentLength * 2])
+        position += 8 + contentLength * 2
+    assert index == [struct.unpack('>2i', shxBytes[i:i + 8]) for i in range(100, len(shxBytes), 8)]
+    return shapeType, box, records
+
+
+def readPolyRecord(record):
+    """Return the shape type, bounding box, and points of a single part polyline or polygon record"""
+    shapeType, *box = struct.unpack('<i4d', record[:36])
+    numParts, numPoints, part = struct.unpack('<3i', record[36:48])
+    assert (numParts, part) == (1, 0)
+    assert len(record) == 48 + 16 * numPoints
+    points = numpy.frombuffer(record[48:], dtype='<f8').reshape(-1, 2)
+    return shapeType, box, points.tolist()
+
+
+def readDBF(writer, df):
+    """Return the field descriptors and the field strings of each record in the .dbf file"""
+    dbfBytes = b''.join(bytes(part) for part in writer.getDBF(df, makeFields(df)))
+    version, recordCount, headerLength, recordLength = struct.unpack('<B3xIHH', dbfBytes[:12])
+    assert version == 3
+    assert dbfBytes[headerLength - 1:headerLength] == b'\r'
+    assert dbfBytes[-1:] == b'\x1a'
+    assert len(dbfBytes) == headerLength + recordCount * recordLength + 1
+
+    fields = []
+    for position in range(32, headerLength - 1, 32):
+        name, fieldType, width, decimals = struct.unpack('<11sc4xBB14x', dbfBytes[position:position + 32])
+        fields.append((name.rstrip(b'\x00').decode('utf-8'), fieldType.decode('ascii'), width, decimals))
+    assert 1 + sum(width for _, _, width, _ in fields) == recordLength
+
+    records = []
+    for row in range(recordCount):
+        record = dbfBytes[headerLength + row * recordLength:headerLength + (row + 1) * recordLength]
+        assert record[:1] == b' ' # Not deleted
+        values = []
+        position = 1
+        for _, _, width, _ in fields:
+            values.append(record[position:position + width])
+            position += width
+        records.append(values)
+    return fields, records
+
+
+def test_point_records():
+    coordinates = [(-122.68, 45.52), (-122.5, 45.6), (-121.76, 46.85)]
+    writer = shapefile_writer.ShapefileWriter(shapefile_writer.POINT, coordinates, [0, 1, 2, 3])
+    shapeType, box, records = readSHP(writer)
+    assert shapeType == shapefile_writer.POINT
+    assert box == [-122.68, 45.52, -121.76, 46.85]
+    assert [struct.unpack('<i2d', record) for record in records] == [(1, x, y) for x, y in coordinates]
+
+
+def test_polyline_records():
+    coordinates = [(0.0, 0.0), (2.0, 1.0), (3.0, -1.0), (10.0, 10.0), (11.0, 12.0)]
+    writer = shapefile_writer.ShapefileWriter(shapefile_writer.POLYLINE, coordinates, [0, 3, 5])
+    shapeType, box, records = readSHP(writer)
+    assert shapeType == shapefile_writer.POLYLINE
+    assert box == [0.0, -1.0, 11.0, 12.0]
+    assert [readPolyRecord(record) for record in records] == [
+        (shapefile_writer.POLYLINE, [0.0, -1.0, 3.0, 1.0], [[0.0, 0.0], [2.0, 1.0], [3.0, -1.0]]),
+        (shapefile_writer.POLYLINE, [10.0, 10.0, 11.0, 12.0], [[10.0, 10.0], [11.0, 12.0]]),
+    ]
+
+
+def test_polygon_rings_are_clockwise_far_from_origin():
+    # Tiny rings far from the origin, where an area summed over the whole layer loses the sign of each ring
+    x = -100.0 + 1e-9
+    y = 40.0
+    counterclockwise = [(x, y), (x + 1e-7, y), (x + 1e-7, y + 1e-7), (x, y)]
+    clockwise = [(x, y), (x, y + 1e-7), (x + 1e-7, y + 1e-7), (x, y)]
+    writer = shapefile_writer.ShapefileWriter(shapefile_writer.POLYGON, counterclockwise + clockwise + clockwise,
+                                              [0, 4, 8, 12])
+    points = [readPolyRecord(record)[2] for record in readSHP(writer)[2]]
+    assert points[0] == [list(point) for point in reversed(counterclockwise)]
+    assert points[1] == points[2] == [list(point) for point in clockwise]
+
+
+def test_empty_layer():
+    writer = shapefile_writer.ShapefileWriter(shapefile_writer.POLYGON, numpy.empty((0, 2)), [0])
+    shapeType, box, records = readSHP(writer)
+    assert (shapeType, box, records) == (shapefile_writer.POLYGON, [0.0, 0.0, 0.0, 0.0], [])
+
+    df = pandas.DataFrame({'name': pandas.Series([], dtype=object), 'count': pandas.Series([], dtype='int64'),
+                           'value': pandas.Series([], dtype='float64')})
+    fields, records = readDBF(writer, df)
+    assert fields == [('name', 'C', 80, 0), ('count', 'N', 9, 0), ('value', 'N', 24, 15)]
+    assert records == []
+
+
+def makeWriter(featureCount):
+    """Return a point writer with the given number of features, for checking .dbf output"""
+    return shapefile_writer.ShapefileWriter(shapefile_writer.POINT, numpy.zeros((featureCount, 2)),
+                                            numpy.arange(featureCount + 1))
+
+
+def test_integer_fields_match_printf():
+    values = [0, -7, 123456789, -123456789, 2 ** 63 - 1, -2 ** 63]
+    df = pandas.DataFrame({'count': values})
+    fields, records = readDBF(makeWriter(len(values)), df)
+    # Values wider than OGR's default width widen the field rather than lose digits
+    assert fields == [('count', 'N', 20, 0)]
+    assert records == [[b'%20d' % value] for value in values]
+
+
+def test_real_fields_match_printf():
+    values = [0.1, -1024.5, 0.0, -0.0, 2.5e-16, 0.5e-15, 123456789.987654321, -1e20, float('nan')]
+    df = pandas.DataFrame({'value': values})
+    fields, records = readDBF(makeWriter(len(values)), df)
+    width = len(b'%.15f' % -1e20)
+    assert fields == [('value', 'N', width, 15)]
+    expected = [b'%*.15f' % (width, value) for value in values[:-1]] + [b' ' * width] # NaN is left blank
+    assert records == [[field] for field in expected]
+
+    df = pandas.DataFrame({'value': [1e300]})
+    with pytest.raises(ValueError, match='too wide'):
+        readDBF(makeWriter(1), df)
+
+
+def test_strings_are_cut_between_characters():
+    text = ['plain', 'Forêt', 'a' * 79 + 'é', 'ñ' * 50, '日本' * 30, None]
+    df = pandas.DataFrame({'name': pandas.Series(text, dtype=object)})
+    fields, records = readDBF(makeWriter(len(text)), df)
+    assert fields == [('name', 'C', 80, 0)]
+    for value, (field,) in zip(text, records):
+        expected = (value or '').encode('utf-8')[:80].decode('utf-8', 'ignore').encode('utf-8')
+        assert field == expected.ljust(80)
+        field.decode('utf-8') # Every field is valid UTF-8
+
+
+def test_layer_too_large_for_shapefile(tmp_path, monkeypatch):
+    monkeypatch.setattr(shapefile_writer, 'MAX_FILE_BYTES', 200)
+    writer = shapefile_writer.ShapefileWriter(shapefile_writer.POLYLINE, numpy.zeros((10, 2)), [0, 5, 10])
+    df = pandas.DataFrame({'count': [1, 2]})
+    with pytest.raises(ValueError, match='shapefile can only hold'):
+        writer.write(str(tmp_path / 'large.shp'), '4326', df, makeFields(df))
+    assert list(tmp_path.iterdir()) == [] # No partial shapefile is left behind
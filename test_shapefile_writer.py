@@ -0,0 +1,92 @@
+# Purpose: GEOG 498 term project, checks the columnar shapefile writer against the OGR writer
+
+import pytest
+
+ogr = pytest.importorskip('osgeo.ogr')
+pytest.importorskip('pandas')
+
+import csv_analyzer
+
+POINT_CSV = """name,count,value,latitude,longitude
+Mill Creek,12,3.25,45.52,-122.68
+Forêt,-7,0.1,45.6,-122.5
+Summit,123456789,-1024.5,46.85,-121.76
+"""
+
+# Ring a is counterclockwise and ring b is clockwise, so polygon rewinding is covered both ways
+TRACK_CSV = """name,latitude,longitude,elevation
+a,45.50,-122.70,10
+a,45.50,-122.60,12
+a,45.60,-122.60,15
+b,46.00,-121.00,300
+b,46.10,-121.00,320
+b,46.10,-120.90,310
+"""
+
+
+def writeCSV(tmp_path, text):
+    """Write csv text to a file in the test directory and return its path"""
+    path = tmp_path / 'input.csv'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def readLayer(path):
+    """Return the geometry type, spatial reference, field definitions, and features of a shapefile"""
+    dataSource = ogr.Open(path)
+    assert dataSource is not None, f"{path} was not written"
+    layer = dataSource.GetLayer()
+    defn = layer.GetLayerDefn()
+    fields = []
+    for i in range(defn.GetFieldCount()):
+        fieldDefn = defn.GetFieldDefn(i)
+        fields.append((fieldDefn.GetName(), fieldDefn.GetType(), fieldDefn.GetWidth(), fieldDefn.GetPrecision()))
+    features = []
+    for feature in layer:
+        values = [feature.GetField(i) for i in range(defn.GetFieldCount())]
+        features.append((feature.GetGeometryRef().ExportToWkt(), values))
+    return layer.GetGeomType(), layer.GetSpatialRef().ExportToWkt(), fields, features
+
+
+def assertWritersMatch(processor, tmp_path):
+    """Write the processor's layer with OGR and with the columnar writer, and compare what OGR reads back"""
+    layers = []
+    for native in (False, True):
+        output = str(tmp_path / ('native.shp' if native else 'ogr.shp'))
+        processor.createShapefile(wkid='4326', output=output, fields=processor.fieldObjects, native=native)
+        layers.append(readLayer(output))
+
+    ogrLayer, nativeLayer = layers
+    assert ogrLayer[3], "no features were written"
+    assert nativeLayer[0] == ogrLayer[0] # Geometry type
+    assert nativeLayer[1] == ogrLayer[1] # Spatial reference
+    assert nativeLayer[2] == ogrLayer[2] # Field definitions
+    assert nativeLayer[3] == ogrLayer[3] # Geometry and values of each feature
+
+
+def test_point_layer_matches_ogr(tmp_path):
+    processor = csv_analyzer.PointProcessor(writeCSV(tmp_path, POINT_CSV))
+    processor.addGeometry(latField='latitude', lonField='longitude')
+    assertWritersMatch(processor, tmp_path)
+
+
+def test_polyline_layer_matches_ogr(tmp_path):
+    processor = csv_analyzer.PolylineProcessor(writeCSV(tmp_path, TRACK_CSV))
+    processor.addGeometry(nodeField='nodes')
+    assertWritersMatch(processor, tmp_path)
+
+
+def test_polygon_layer_matches_ogr(tmp_path):
+    processor = csv_analyzer.PolygonProcessor(writeCSV(tmp_path, TRACK_CSV))
+    processor.addGeometry(nodeField='nodes')
+    assertWritersMatch(processor, tmp_path)
+
+
+def test_native_writer_widens_numeric_fields(tmp_path):
+    processor = csv_analyzer.PointProcessor(writeCSV(tmp_path, "name,count,latitude,longitude\n"
+                                                               "Big,1234567890,45.5,-122.5\n"))
+    processor.addGeometry(latField='latitude', lonField='longitude')
+    output = str(tmp_path / 'native.shp')
+    processor.createShapefile(wkid='4326', output=output, fields=processor.fieldObjects, native=True)
+    features = readLayer(output)[3]
+    assert features[0][1][1] == 1234567890
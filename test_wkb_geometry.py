@@ -0,0 +1,75 @@
+# Purpose: GEOG 498 term project, checks WKB geometry built from node strings
+
+import struct
+import numpy
+import pytest
+
+pandas = pytest.importorskip('pandas')
+
+import wkb_geometry
+
+# Node strings in the 'lat lon,lat lon' form that the polyline and polygon processors build from a csv
+NODES = ['45.5 -122.7,45.5 -122.6,45.6 -122.6,45.5 -122.7',
+         '46.0 -121.0,46.1 -121.0',
+         '-33.925 18.4241,-33.9 18.5,-34.0 18.45,-33.925 18.4241']
+
+
+def packWKB(wkbType, points):
+    """Return the little-endian WKB of a single ring polygon or a linestring, packed one value at a time"""
+    if wkbType == wkb_geometry.POLYGON:
+        header = struct.pack('<BIII', 1, wkbType, 1, len(points))
+    else:
+        header = struct.pack('<BII', 1, wkbType, len(points))
+    return header + b''.join(struct.pack('<2d', x, y) for x, y in points)
+
+
+def getWKT(wkbType, nodes):
+    """Return WKT built from a node string the way the processors built geometry before WKB"""
+    XYList = []
+    for node in nodes.split(','):
+        lat = node.split(' ')[0]
+        lon = node.split(' ')[1]
+        XYList.append(f"{lon} {lat}")
+    if wkbType == wkb_geometry.POLYGON:
+        return f"POLYGON (({','.join(XYList)}))"
+    return f"LINESTRING ({','.join(XYList)})"
+
+
+def getWKTPoints(wkt):
+    """Return the x/y pairs of a WKT linestring or single ring polygon"""
+    pairs = wkt[wkt.rindex('(') + 1:wkt.index(')')].split(',')
+    return [tuple(float(value) for value in pair.split(' ')) for pair in pairs]
+
+
+@pytest.mark.parametrize('wkbType', [wkb_geometry.LINESTRING, wkb_geometry.POLYGON])
+def test_wkb_matches_wkt_from_nodes(wkbType):
+    coordinates, offsets = wkb_geometry.parseNodes(pandas.Series(NODES))
+    assert offsets.tolist() == [0, 4, 6, 10]
+    wkbList = wkb_geometry.buildWKB(wkbType, coordinates, offsets)
+    # One WKB per feature, in the order of the node strings
+    assert wkbList == [packWKB(wkbType, getWKTPoints(getWKT(wkbType, nodes))) for nodes in NODES]
+
+
+def test_wkb_matches_ogr():
+    ogr = pytest.importorskip('osgeo.ogr')
+    coordinates, offsets = wkb_geometry.parseNodes(pandas.Series(NODES))
+    for wkbType in (wkb_geometry.LINESTRING, wkb_geometry.POLYGON):
+        wkbList = wkb_geometry.buildWKB(wkbType, coordinates, offsets)
+        for wkb, nodes in zip(wkbList, NODES):
+            expected = ogr.CreateGeometryFromWkt(getWKT(wkbType, nodes))
+            assert ogr.CreateGeometryFromWkb(wkb).ExportToWkt() == expected.ExportToWkt()
+
+
+def test_wkb_of_many_features():
+    rng = numpy.random.default_rng(0)
+    counts = rng.integers(1, 20, 5000)
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts)))
+    coordinates = rng.normal(size=(offsets[-1], 2)) * 180
+    for wkbType in (wkb_geometry.LINESTRING, wkb_geometry.POLYGON):
+        wkbList = wkb_geometry.buildWKB(wkbType, coordinates, offsets)
+        assert wkbList == [packWKB(wkbType, coordinates[start:end].tolist())
+                           for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def test_wkb_of_no_features():
+    assert wkb_geometry.buildWKB(wkb_geometry.POLYGON, numpy.empty((0, 2)), [0]) == []
@@ -0,0 +1,57 @@
+# Purpose: GEOG 498 term project, WKB geometry construction from node strings
+
+import numpy
+import shapefile_writer
+
+# WKB geometry type codes
+LINESTRING = 2
+POLYGON = 3
+
+# Fixed-size start of each feature's little-endian WKB. Polygons have a single ring, so both types are followed
+# directly by their points
+LINESTRING_HEADER = numpy.dtype([('byteOrder', 'u1'), ('wkbType', '<u4'), ('numPoints', '<u4')])
+POLYGON_HEADER = numpy.dtype([('byteOrder', 'u1'), ('wkbType', '<u4'), ('numRings', '<u4'), ('numPoints', '<u4')])
+
+
+def parseNodes(nodes):
+    """Parse a series of 'lat lon,lat lon' node strings into an array of x/y coordinates and the index of each
+    feature's first node, followed by the total node count"""
+    nodes = nodes.astype(str)
+    counts = nodes.str.count(',').to_numpy() + 1 # Number of nodes in each feature
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts)))
+    values = numpy.array(','.join(nodes).replace(',', ' ').split(' '), dtype=float)
+    coordinates = numpy.ascontiguousarray(values.reshape(-1, 2)[:, ::-1]) # Swap lat/lon to x/y
+    return coordinates, offsets
+
+
+def encodeWKB(wkbType, coordinates, offsets):
+    """Return the WKB of every feature as one uint8 buffer, along with where each feature's WKB starts, followed by
+    the buffer length"""
+    counts = numpy.diff(offsets)
+    headerDtype = LINESTRING_HEADER if wkbType == LINESTRING else POLYGON_HEADER
+    headers = numpy.zeros(len(counts), dtype=headerDtype)
+    headers['byteOrder'] = 1 # Little endian
+    headers['wkbType'] = wkbType
+    headers['numPoints'] = counts
+    if wkbType == POLYGON:
+        headers['numRings'] = 1
+
+    # Allocate the buffer once, then copy each header and the points that follow it into place
+    sizes = headerDtype.itemsize + 16 * counts
+    starts = numpy.concatenate(([0], numpy.cumsum(sizes)))
+    buffer = numpy.empty(int(starts[-1]), dtype=numpy.uint8)
+    shapefile_writer.copyRows(buffer, starts[:-1], headers.view(numpy.uint8).reshape(-1, headerDtype.itemsize))
+    pointStarts = numpy.repeat(starts[:-1] + headerDtype.itemsize - 16 * offsets[:-1], counts)
+    pointStarts += 16 * numpy.arange(len(coordinates))
+    shapefile_writer.copyRows(buffer, pointStarts, coordinates.view(numpy.uint8).reshape(-1, 16))
+    return buffer, starts
+
+
+def buildWKB(wkbType, coordinates, offsets):
+    """Return a list with the WKB of each feature in order"""
+    coordinates = numpy.ascontiguousarray(coordinates, dtype='<f8').reshape(-1, 2)
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    buffer, starts = encodeWKB(wkbType, coordinates, offsets)
+    # Cut the buffer into per-feature WKB
+    buffer = buffer.tobytes()
+    return [buffer[start:end] for start, end in zip(starts[:-1].tolist(), starts[1:].tolist())]